@@ -1,12 +1,16 @@
 import os
 import re
 import asyncio
+import ahocorasick
 import logging
 import time
-from collections import deque
-from threading import Thread
-from flask import Flask
-from telethon import TelegramClient, events, types
+import functools
+import copy
+import atexit
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from aiohttp import web
+from telethon import TelegramClient, events, errors
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -15,17 +19,27 @@ load_dotenv()
 # ======================
 #  INITIAL SETUP
 # ======================
+# Records are handed to a background thread so console/file writes never
+# block the event loop
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+log_handlers = [logging.StreamHandler(), logging.FileHandler('bot.log')]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+# The listener's handlers apply the real format
+queue_handler = QueueHandler(log_queue)
+queue_handler.setFormatter(logging.Formatter('%(message)s'))
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('bot.log')
-    ]
+    handlers=[queue_handler]
 )
 
-app = Flask(__name__)
-
 # ======================
 #  CONFIGURATION LOADER
 # ======================
@@ -39,10 +53,10 @@ def get_env_variable(name, is_int=True, optional=False):
     except KeyError:
         if optional:
             return None
-        logging.error(f"❌ Missing required environment variable: {name}")
+        logging.error("❌ Missing required environment variable: %s", name)
         raise
     except ValueError as e:
-        logging.error(f"❌ Invalid value for {name}: {str(e)}")
+        logging.error("❌ Invalid value for %s: %s", name, e)
         raise
 
 # ======================
@@ -62,48 +76,155 @@ try:
 
     # Multiple target channels
     target_channels_str = get_env_variable('TARGET_CHANNELS', is_int=False)
-    target_channels = [int(ch.strip()) for ch in target_channels_str.split(',') if ch.strip()]
+    # Deduplicated, keeping the configured order
+    target_channels = list(dict.fromkeys(int(ch.strip()) for ch in target_channels_str.split(',') if ch.strip()))
     if not target_channels:
         raise ValueError("No valid target channels configured")
 
     # Optional settings with defaults
     queue_delay = int(get_env_variable('QUEUE_DELAY', optional=True) or 120)
-    rate_limit = int(get_env_variable('RATE_LIMIT', optional=True) or 60)
     port = int(get_env_variable('PORT', optional=True) or 8080)
+    send_rate = int(get_env_variable('SEND_RATE', optional=True) or 20)
+    if send_rate < 1:
+        raise ValueError("SEND_RATE must be at least 1")
+    queue_size = int(get_env_variable('QUEUE_SIZE', optional=True) or 1000)
+    if queue_size < 1:
+        raise ValueError("QUEUE_SIZE must be at least 1")
+    send_concurrency = int(get_env_variable('SEND_CONCURRENCY', optional=True) or 8)
+    if send_concurrency < 1:
+        raise ValueError("SEND_CONCURRENCY must be at least 1")
+    batch_max = int(get_env_variable('BATCH_MAX', optional=True) or 1)
 
 except Exception as e:
-    logging.critical(f"❌ Configuration error: {str(e)}")
+    logging.critical("❌ Configuration error: %s", e)
     exit(1)
 
 # ======================
-#  FLASK KEEP-ALIVE
+#  WEB KEEP-ALIVE
 # ======================
-@app.route('/')
-def home():
-    return "I'm alive!"
+async def home(request):
+    return web.Response(text="I'm alive!")
 
-@app.route('/health')
-def health():
-    return ("Bot is running and connected!", 200) if client.is_connected() else ("Bot is disconnected!", 503)
+async def health(request):
+    if client.is_connected():
+        return web.Response(text="Bot is running and connected!", status=200)
+    return web.Response(text="Bot is disconnected!", status=503)
 
-def run_web():
-    app.run(host='0.0.0.0', port=port)
+app = web.Application()
+app.add_routes([web.get('/', home), web.get('/health', health)])
 
-def keep_alive():
-    Thread(target=run_web, daemon=True).start()
+async def start_web():
+    """Serve the keep-alive routes on the bot's own event loop"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    return runner
+
+# ======================
+#  SEND RATE LIMITER
+# ======================
+class AsyncTokenBucket:
+    """Token bucket allowing `rate` sends per `per` seconds, with bursts"""
+
+    def __init__(self, rate, per):
+        self.capacity = rate
+        self.fill_rate = rate / per
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.fill_rate)
+            self._updated = now
+
+    async def take(self):
+        """Wait until a token is available and consume it"""
+        async with self._lock:
+            self._refill()
+            # Loop, since a flood-wait penalty may arrive while sleeping
+            while self._tokens < 1:
+                needed = (1 - self._tokens) / self.fill_rate + max(0, self._updated - time.monotonic())
+                await asyncio.sleep(needed)
+                self._refill()
+            self._tokens -= 1
+
+    def penalize(self, seconds):
+        """Empty the bucket and hold off refilling after a flood wait"""
+        self._tokens = 0
+        self._updated = max(self._updated, time.monotonic() + seconds)
 
 # ======================
 #  TELEGRAM BOT SETUP
 # ======================
-client = TelegramClient('bot_session', api_id, api_hash)
-message_queue = deque()
-is_forwarding = False
-last_forward_time = 0
+# Telethon reconnects on its own; retry forever instead of watching raw updates
+client = TelegramClient(
+    'bot_session', api_id, api_hash,
+    connection_retries=-1,
+    retry_delay=5,
+    auto_reconnect=True,
+    request_retries=5
+)
+message_queue = asyncio.Queue(maxsize=queue_size)
+# Telegram's ~20 msg/min limit applies per chat, so each target gets its own
+# bucket and a flood wait on one channel does not hold up the others
+send_buckets = {channel: AsyncTokenBucket(send_rate, 60) for channel in target_channels}
+send_semaphore = asyncio.Semaphore(send_concurrency)
+target_peers = {}
 
 # ======================
 #  FORBIDDEN WORD LIST
 # ======================
-forbidden_words = ['box', 'slot', 'square', 'thxbox', 'thx']
+# Normalized once: stripped, lowercased and deduplicated
+forbidden_words = frozenset(
+    word.strip().lower()
+    for word in ['box', 'slot', 'square', 'thxbox', 'thx']
+    if word.strip()
+)
+
+@functools.lru_cache(maxsize=32)
+def compile_forbidden_words(words):
+    """Build one case-insensitive pattern matching #word or plain word"""
+    # Longest first, so the pattern is the same whatever order words come in
+    ordered = sorted(words, key=lambda word: (-len(word), word))
+    # Repeats let joined words like "slotbox" go in one match. The repeat is
+    # possessive so a failed match never retries every split of the run
+    return re.compile(
+        r'#?(?:' + '|'.join(re.escape(word) for word in ordered) + r')++\b',
+        re.IGNORECASE
+    )
+
+# Precompiled once so the per-message cleaning path is a single regex pass
+_FORBIDDEN_RE = compile_forbidden_words(tuple(forbidden_words))
+
+_TIMESTAMP_RES = tuple(re.compile(pattern) for pattern in (
+    r'\d{2}-\d{2}-\d{4} \d{2}:\d{2}:\d{2}$',
+    r'\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}$',
+    r'\d{2}:\d{2}:\d{2} \d{2}-\d{2}-\d{4}$',
+    r'\d{2}:\d{2} \d{2}-\d{2}-\d{4}$',
+    r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$'
+))
+
+# ======================
+#  FORWARD FILTER TERMS
+# ======================
+# Tuples, since the automata below are built from them once at import
+valid_numbers = ('USDT', '599', '666', '700', '777', '888', '899', '999', '1000', '1111', '1200', '1500', '1999', '1888', '2000', '2500', '2777', '2888', '2999', '3000', '3100', '3300', '3333', '3500', '3786', '4000', '4444', '4500', '5000', '5500', '6000', '6666', '10000')
+forbidden_terms = ('http', '@', 'thx')
+
+def build_automaton(words):
+    """Build an Aho-Corasick automaton matching any of the given words"""
+    automaton = ahocorasick.Automaton()
+    for word in words:
+        automaton.add_word(word, word)
+    automaton.make_automaton()
+    return automaton
+
+# One automaton per keyword set so each check is a single pass over the text
+_VALID_AC = build_automaton(valid_numbers)
+_FORBIDDEN_LOWER = tuple(term.lower() for term in forbidden_terms)
+_FORBIDDEN_AC = build_automaton(_FORBIDDEN_LOWER)
 
 # ======================
 #  MESSAGE PROCESSING
@@ -113,13 +234,16 @@ def should_forward(message_text, has_media):
     if not message_text or has_media:
         return False
 
-    valid_numbers = ['USDT', '599', '666', '700', '777', '888', '899', '999', '1000', '1111', '1200', '1500', '1999', '1888', '2000', '2500', '2777', '2888', '2999', '3000', '3100', '3300', '3333', '3500', '3786', '4000', '4444', '4500', '5000', '5500', '6000', '6666', '10000']
-    forbidden_terms = ['http', '@', 'thx']
+    return _text_allowed(message_text)
 
-    contains_number = any(num in message_text for num in valid_numbers)
-    contains_forbidden = any(term.lower() in message_text.lower() for term in forbidden_terms)
+@functools.lru_cache(maxsize=2048)
+def _text_allowed(message_text):
+    """Text-only part of should_forward, cached for reposted messages"""
+    # Forbidden terms are checked first so rejected messages skip the number scan
+    if next(_FORBIDDEN_AC.iter(message_text.lower()), None) is not None:
+        return False
 
-    return contains_number and not contains_forbidden
+    return next(_VALID_AC.iter(message_text), None) is not None
 
 def clean_message_text(text):
     """Remove timestamp line from message text"""
@@ -132,16 +256,8 @@ def clean_message_text(text):
     # Remove last line if it matches a timestamp pattern
     if lines:
         last_line = lines[-1]
-        timestamp_patterns = [
-            r'\d{2}-\d{2}-\d{4} \d{2}:\d{2}:\d{2}$',
-            r'\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}$',
-            r'\d{2}:\d{2}:\d{2} \d{2}-\d{2}-\d{4}$',
-            r'\d{2}:\d{2} \d{2}-\d{2}-\d{4}$',
-            r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$'
-        ]
-        
-        for pattern in timestamp_patterns:
-            if re.search(pattern, last_line):
+        for pattern in _TIMESTAMP_RES:
+            if pattern.search(last_line):
                 lines = lines[:-1]
                 break
     
@@ -151,113 +267,178 @@ def remove_forbidden_words(text, forbidden_list):
     """
     Remove forbidden words while preserving line structure.
     """
-    if not text:
+    if not text or not forbidden_list:
         return text
-    
-    # Process each line individually
-    cleaned_lines = []
-    for line in text.split('\n'):
-        original_line = line
-        for word in forbidden_list:
-            # Remove #word or plain word, case insensitive
-            line = re.sub(rf'#?{re.escape(word)}\b', '', line, flags=re.IGNORECASE)
-        cleaned_lines.append(line.rstrip())
-    
-    return '\n'.join(cleaned_lines)
+
+    if forbidden_list is forbidden_words:
+        pattern = _FORBIDDEN_RE
+    else:
+        pattern = compile_forbidden_words(tuple(forbidden_list))
+
+    # One pass over the whole text; matches never span a newline, so only
+    # the trailing whitespace needs trimming per line
+    return '\n'.join(line.rstrip() for line in pattern.sub('', text).split('\n'))
+
+def clip_entities(entities, text):
+    """Keep entities that fit in text, cutting any that run past its end"""
+    # Telegram offsets count UTF-16 code units, not Python characters
+    limit = len(text.encode('utf-16-le')) // 2
+    clipped = []
+    for entity in entities or ():
+        if entity.offset >= limit:
+            continue
+        if entity.offset + entity.length > limit:
+            entity = copy.copy(entity)
+            entity.length = limit - entity.offset
+        clipped.append(entity)
+    return clipped
+
+@functools.lru_cache(maxsize=2048)
+def _clean_text(text):
+    """Full cleaning pipeline, cached for reposted messages"""
+    return remove_forbidden_words(clean_message_text(text), forbidden_words)
+
+# Appended to every forwarded message
+_SUFFIX = " #Binance #RedPacketHub "
 
 # ======================
 #  MESSAGE HANDLERS
 # ======================
 @client.on(events.NewMessage(chats=source_channels))
 async def handle_new_message(event):
-    global is_forwarding, last_forward_time
-
     try:
         message_text = event.message.message or ""
-        logging.info(f"📥 New message: {message_text[:100]}...")
+        logging.info("📥 New message: %.100s...", message_text)
 
         if should_forward(message_text, event.message.media):
-            current_time = time.time()
-            if not is_forwarding or (current_time - last_forward_time > rate_limit):
-                await forward_message(event)
-                last_forward_time = current_time
-                is_forwarding = True
-                client.loop.create_task(process_queue())
-            else:
-                message_queue.append(event)
-                logging.info(f"🕒 Queued message (queue size: {len(message_queue)})")
+            try:
+                message_queue.put_nowait(event)
+                logging.info("🕒 Queued message (queue size: %d)", message_queue.qsize())
+            except asyncio.QueueFull:
+                logging.warning("⚠️ Queue full (%d), dropping message", queue_size)
         else:
             logging.debug("❌ Message skipped due to filter conditions")
 
     except Exception as e:
-        logging.error(f"🔥 Error in handler: {str(e)}")
+        logging.error("🔥 Error in handler: %s", e)
+
+async def send_to_channel(channel, text, entities):
+    """Send a single formatted message, waiting out one flood limit if hit"""
+    bucket = send_buckets[channel]
+    for attempt in range(2):
+        await bucket.take()
+        try:
+            async with send_semaphore:
+                await client.send_message(
+                    entity=target_peers.get(channel, channel),
+                    message=text,
+                    formatting_entities=entities,
+                    link_preview=False
+                )
+            logging.info("✅ Forwarded to %s", channel)
+            return
+        except errors.FloodWaitError as e:
+            logging.warning("⏳ Flood wait %ds for %s", e.seconds, channel)
+            bucket.penalize(e.seconds)
+            if attempt:
+                raise
 
 async def forward_message(event):
     """Forward message to all target channels with cleaned formatting"""
     try:
         # Clean the message text
-        cleaned_text = clean_message_text(event.message.message or "")
-        cleaned_text = remove_forbidden_words(cleaned_text, forbidden_words)
+        raw_text = event.message.message or ""
+        cleaned_text = _clean_text(raw_text)
 
-        # Add bold formatted hashtags at the end
-        formatted_text = f"{cleaned_text} #Binance #RedPacketHub "
-        
-        for channel in target_channels:
-            try:
-                await client.send_message(
-                    entity=channel,
-                    message=formatted_text,
-                    formatting_entities=event.message.entities,
-                    link_preview=False,
-                    parse_mode='html'
-                )
-                logging.info(f"✅ Forwarded to {channel}")
-                await asyncio.sleep(1)
-            except Exception as e:
-                logging.error(f"❌ Send failed for {channel}: {str(e)}")
-                await asyncio.sleep(3)
+        # Add the hashtags at the end
+        formatted_text = cleaned_text + _SUFFIX
+
+        # Entity offsets stay valid when cleaning only cut the end of the
+        # text (usually the timestamp line). The text is already plain, so an
+        # empty list also skips Telethon's parse_mode pass.
+        if raw_text.startswith(cleaned_text):
+            entities = clip_entities(event.message.entities, cleaned_text)
+        else:
+            entities = []
+
+        # Send to all channels concurrently instead of one round-trip at a time
+        results = await asyncio.gather(
+            *(send_to_channel(channel, formatted_text, entities)
+              for channel in target_channels),
+            return_exceptions=True
+        )
+        for channel, result in zip(target_channels, results):
+            if isinstance(result, Exception):
+                logging.error("❌ Send failed for %s: %s", channel, result)
 
     except Exception as e:
-        logging.error(f"🔥 Forwarding error: {str(e)}")
+        logging.error("🔥 Forwarding error: %s", e)
 
 async def process_queue():
-    """Process queued messages with delay"""
-    global is_forwarding
-    while message_queue:
-        await asyncio.sleep(queue_delay)
-        event = message_queue.popleft()
-        await forward_message(event)
-    is_forwarding = False
-
-# ======================
-#  CONNECTION MANAGEMENT
-# ======================
-@client.on(events.Raw)
-async def handle_raw(event):
-    if isinstance(event, types.UpdateConnectionState):
-        if event.state == types.ConnectionState.disconnected:
-            logging.warning("⚠️ Bot disconnected! Attempting to reconnect...")
-            await asyncio.sleep(5)
-            await client.connect()
+    """Forward queued messages in batches, spacing the batches out"""
+    last_forward_time = None
+    while True:
+        had_backlog = not message_queue.empty()
+        event = await message_queue.get()
+
+        # Idle arrivals go out at once (the token buckets pace sends); only
+        # messages that queued behind a forward wait queue_delay
+        if had_backlog and last_forward_time is not None:
+            wait = last_forward_time + queue_delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+        # Coalesce up to batch_max queued messages into one concurrent round
+        batch = [event]
+        while len(batch) < batch_max and not message_queue.empty():
+            batch.append(message_queue.get_nowait())
+
+        await asyncio.gather(*(forward_message(queued) for queued in batch))
+        last_forward_time = time.monotonic()
+        for _ in batch:
+            message_queue.task_done()
 
 # ======================
 #  MAIN EXECUTION
 # ======================
+async def resolve_target_peers():
+    """Resolve each target channel to an input peer once at startup"""
+    for channel in target_channels:
+        try:
+            target_peers[channel] = await client.get_input_entity(channel)
+        except Exception as e:
+            logging.error("❌ Could not resolve %s: %s", channel, e)
+
 async def run_bot():
+    runner = None
+    consumer = None
     try:
+        runner = await start_web()
         await client.start(bot_token=bot_token)
         logging.info("🤖 Bot started successfully!")
+        await resolve_target_peers()
+        consumer = asyncio.create_task(process_queue())
         await client.run_until_disconnected()
     except Exception as e:
-        logging.error(f"❌ Fatal bot error: {str(e)}")
+        logging.error("❌ Fatal bot error: %s", e)
     finally:
+        if consumer is not None:
+            consumer.cancel()
+        if runner is not None:
+            await runner.cleanup()
         logging.info("🛑 Bot session ended")
 
 if __name__ == "__main__":
-    keep_alive()
+    # Use the faster libuv event loop where it is available
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
     try:
         asyncio.run(run_bot())
     except KeyboardInterrupt:
         logging.info("🛑 Bot stopped by user")
     except Exception as e:
-        logging.error(f"❌ Unexpected error: {str(e)}")
+        logging.error("❌ Unexpected error: %s", e)
@@ -0,0 +1,56 @@
+import importlib
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='module')
+def main(tmp_path_factory):
+    """Import main.py with dummy credentials, keeping bot.log and the session out of the repo"""
+    for name, value in {
+        'API_ID': '1',
+        'API_HASH': 'test',
+        'BOT_TOKEN': 'test',
+        'SOURCE_CHANNELS': '-1001',
+        'TARGET_CHANNELS': '-1002',
+    }.items():
+        os.environ.setdefault(name, value)
+
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('bot'))
+    sys.path.insert(0, ROOT)
+    try:
+        yield importlib.import_module('main')
+    finally:
+        sys.path.remove(ROOT)
+        os.chdir(cwd)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('slotbox 1000', ' 1000'),
+    ('squarebox', ''),
+    ('#THXBOX #Box', ''),
+    ('slot#boxa', '#boxa'),
+    ('boxer 700', 'boxer 700'),
+])
+def test_remove_forbidden_words(main, text, expected):
+    assert main.remove_forbidden_words(text, main.forbidden_words) == expected
+
+
+def test_remove_forbidden_words_empty_list(main):
+    assert main.remove_forbidden_words('#tag x', []) == '#tag x'
+
+
+@pytest.mark.parametrize('text', [
+    'thxbox' * 24 + 'a',
+    # Longest text Telegram allows in one message
+    'box' * 1365 + 'a',
+])
+def test_remove_forbidden_words_no_catastrophic_backtracking(main, text):
+    start = time.perf_counter()
+    main.remove_forbidden_words(text, main.forbidden_words)
+    assert time.perf_counter() - start < 1